@@ -6,6 +6,16 @@ import language_tool_python
 import pandas as pd
 import os
 
+# Headlines scored per matrix product; bounds the similarity block kept in memory
+HEADLINE_CHUNK_SIZE = 4096
+
+
+def _unit_rows(embeddings):
+    """Returns the embeddings as float32 unit-length rows; zero rows stay zero."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-9)
+
 
 class ClickbaitFeatureExtractor:
     """
@@ -158,33 +168,32 @@ class ClickbaitFeatureExtractor:
         clickbait_df = self.get_clickbait_data(csv_file_name)
         headings = clickbait_df["headline"].tolist()
         labels = clickbait_df["clickbait"].tolist()
-        clickbait_count = 0
         total_content = len(content_list)
-        for content in content_list:
-            content_embedding = self.similarity_analyzer.model.encode(
-                [content]
-            )  # Encoding the content
-            heading_embeddings = self.similarity_analyzer.model.encode(
-                headings
-            )  # Encoding all headings
-            # Calculate the similarity between the content and each heading in the dataset
-            similarities = [
-                self.similarity_analyzer.calculate_similarity(
-                    content_embedding, heading_embedding
-                )
-                for heading_embedding in heading_embeddings
-            ]
-            # Ensure we are working with a proper array/list for comparisons
-            similarities = np.array(similarities)
-            # Find the maximum similarity score and map it to a clickbait label
-            max_similarity = np.max(similarities)
-            max_similarity_idx = np.argmax(similarities)
-            # Predict clickbait based on the similarity threshold
-            if (
-                max_similarity >= similarity_threshold
-                and labels[max_similarity_idx] == 1
-            ):
-                clickbait_count += 1
+        # Encode the content and the dataset headlines once, as unit rows
+        model = self.similarity_analyzer.model
+        content_embeddings = _unit_rows(model.encode(content_list))
+        heading_embeddings = _unit_rows(model.encode(headings, batch_size=64))
+        # Track each content item's best headline chunk by chunk rather than
+        # materializing the full content x headlines similarity matrix
+        best_similarities = np.full(total_content, -np.inf, dtype=np.float32)
+        best_indices = np.zeros(total_content, dtype=np.int64)
+        rows = np.arange(total_content)
+        for offset in range(0, len(heading_embeddings), HEADLINE_CHUNK_SIZE):
+            chunk = heading_embeddings[offset : offset + HEADLINE_CHUNK_SIZE]
+            similarities = content_embeddings @ chunk.T
+            chunk_indices = similarities.argmax(axis=1)
+            chunk_best = similarities[rows, chunk_indices]
+            improved = chunk_best > best_similarities
+            best_similarities[improved] = chunk_best[improved]
+            best_indices[improved] = chunk_indices[improved] + offset
+        # Map cosine similarity to [0, 1] and predict clickbait from the best match
+        max_similarities = (best_similarities + 1) * 0.5
+        clickbait_count = int(
+            np.sum(
+                (max_similarities >= similarity_threshold)
+                & (np.asarray(labels)[best_indices] == 1)
+            )
+        )
         # Calculate the clickbait prediction score
         clickbait_prediction_score = (
             clickbait_count / total_content if total_content > 0 else 0.0
@@ -24,7 +24,8 @@ class OpenPhishDataFetcher:
         try:
             response = requests.get(self.feed_url)
             response.raise_for_status()
-            urls = {self.url_cleaner.clean_url(url.strip()) for url in response.text.splitlines() if url.strip()}
+            raw_urls = [url.strip() for url in response.text.splitlines() if url.strip()]
+            urls = set(self.url_cleaner.clean_batch(raw_urls))  # canonical keys
             if not urls:
                 logger.warning("No phishing URLs found in the feed.")
             return urls
@@ -40,11 +41,15 @@ class OpenPhishDataFetcher:
         :param url: str, the URL to check against the phishing URLs.
         :return: bool, True if a phishing trace is found, otherwise False.
         """
-        cleaned_url = self.url_cleaner.clean_url(url)
-        for phishing_url in self.phishing_urls:
-            if self.url_cleaner.compare_urls(cleaned_url, phishing_url, 90): # Set Fuzz ratio to be 90
-                self.has_phishing_trace = True
-                return True
+        cleaned_url = self.url_cleaner.canonical_key(url)
+        # Exact hit in the feed set; no fuzzy scan needed
+        if cleaned_url in self.phishing_urls:
+            self.has_phishing_trace = True
+            return True
+        # Set Fuzz ratio to be 90; one batched scan over the whole feed
+        if self.url_cleaner.compare_many(cleaned_url, self.phishing_urls, 90, limit=1):
+            self.has_phishing_trace = True
+            return True
         return False
         
 # # Example usage:
@@ -3,7 +3,7 @@ This module provides a collection of utility functions and database schema defin
 processing, batch storage, and tracking for the Surf Shelter Multi Label Dataset generation pipeline. 
 """
 # The database schema definition classes
-from .data_schemas.common_crawl_processed_schema import  WebpageData, CommonCrawlProcessed, IndexTracking, WebpageUrlLookup 
+from .data_schemas.common_crawl_processed_schema import  WebpageData, CommonCrawlProcessed, WebpageDoc, IndexTracking, WebpageUrlLookup 
 
 # The helper functions
 from .batch_processor import BatchProcessor
@@ -16,6 +16,7 @@ from .url_cleaner import URLCleaner
 __all__ = [
     "WebpageData", 
     "CommonCrawlProcessed", 
+    "WebpageDoc",
     "IndexTracking",
     "WebpageUrlLookup", 
     "BatchProcessor",
@@ -1,6 +1,6 @@
 import logging
 from typing import Dict, List, Optional
-from .data_schemas.common_crawl_processed_schema import CommonCrawlProcessed
+from .data_schemas.common_crawl_processed_schema import WebpageDoc
 from .html_parser import HTMLParser
 
 # Configure logging
@@ -29,17 +29,19 @@ class BatchDataRetriever:
                                        If a batch is not found, it maps to None.
         """
         try:
-            # Fetch all matching batches in a single query
-            batches = CommonCrawlProcessed.objects(batch_id__in=self.batch_ids)
-            # Convert to dictionary {batch_id -> contents}
-            batch_data_map = {batch.batch_id: batch.contents for batch in batches}
+            # Fetch the webpages of all requested batches in a single query
+            webpages = WebpageDoc.objects(batch_id__in=self.batch_ids)
+            # Group into {batch_id -> {encoded URL -> webpage}}
+            batch_data_map = {}
+            for webpage in webpages:
+                batch_data_map.setdefault(webpage.batch_id, {})[webpage.id] = webpage
             # Ensure all requested batch_ids exist in output (None for missing ones)
             result = {
                 batch_id: batch_data_map.get(batch_id, None)
                 for batch_id in self.batch_ids
             }
             logger.info(
-                f"Retrieved {len(batches)} batches out of {len(self.batch_ids)} requested."
+                f"Retrieved {len(batch_data_map)} batches out of {len(self.batch_ids)} requested."
             )
             return result
         except Exception as e:
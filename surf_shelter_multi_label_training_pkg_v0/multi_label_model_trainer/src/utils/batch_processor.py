@@ -1,12 +1,13 @@
-import base64
+from contextlib import contextmanager
 from .data_schemas.common_crawl_processed_schema import (
-    CommonCrawlProcessed,
     IndexTracking,
     WebpageUrlLookup,
     WebpageData,
+    WebpageDoc,
+    create_indexes,
+    url_key,
 )
 from typing import Dict
-from datetime import datetime, timezone
 
 
 class BatchProcessor:
@@ -27,6 +28,8 @@ class BatchProcessor:
         """
         self.batch_size = 100  # Max 100 records per batch
         self.last_batch = None  # Initialize with no batch data processed yet
+        self._transactions_supported = None  # Resolved lazily on the first flush
+        create_indexes()  # Make sure the lookup and batch queries are index-backed
         self._initialize_last_batch_values()  # Set up initial values for batch tracking
 
     def _initialize_last_batch_values(self):
@@ -69,20 +72,21 @@ class BatchProcessor:
 
     def _fetch_last_batch(self):
         """
-        Retrieves the contents of the last processed batch from the database.
+        Retrieves the encoded URL keys of the last processed batch from the database.
+
+        Flushes only write newly added pages, so the stored page data itself is never
+        needed here; only the webpage document IDs are projected.
 
         Returns:
-            dict: The contents of the last batch if available; otherwise, an empty dictionary.
-        """
-        last_batch_record = CommonCrawlProcessed.objects(
-            batch_id=self.last_updated_batch_id
-        ).first()
-        # Ensure the batch record exists before accessing its contents
-        return (
-            last_batch_record.contents
-            if last_batch_record and hasattr(last_batch_record, "contents")
-            else {}
-        )
+            dict: The last batch's encoded URLs mapped to None, or an empty dictionary.
+        """
+        # Covered by the (batch_id, _id) index; no page data is read
+        return {
+            doc["_id"]: None
+            for doc in WebpageDoc._get_collection().find(
+                {"batch_id": self.last_updated_batch_id}, {"_id": 1}
+            )
+        }
 
     def _insert_batch(self, data):
         """
@@ -91,40 +95,89 @@ class BatchProcessor:
         Ensures each batch has at most `batch_size` entries, storing extra data in new batches.
 
         Args:
-            data (dict): A mapping of encoded URLs (keys) to webpage data (values).
+            data (Iterable[Tuple[str, dict]]): An iterable of (encoded URL, webpage data) pairs.
         """
         lookup_updates = []  # Bulk updates for webpage lookup table
-        for safe_url_key, item in data.items():
+        # Bind hot attributes locally; they only change when a batch is flushed
+        lookup_append = lookup_updates.append
+        batch_size = self.batch_size
+        batch_contents = self.batch_contents
+        batch_id = self.batch_id
+        for safe_url_key, item in data:
             # Prepare lookup update for batch processing
-            lookup_updates.append((safe_url_key, self.batch_id))
-            self.batch_contents[safe_url_key] = (
-                item  # Store as { base64_url: webpage_data }
-            )
-            if len(self.batch_contents) >= self.batch_size:
+            lookup_append((safe_url_key, batch_id))
+            batch_contents[safe_url_key] = item  # Store as { url_key: webpage_data }
+            if len(batch_contents) >= batch_size:
                 self._process_batch(lookup_updates)
-        # Insert remaining data (if any)
-        if self.batch_contents:
+                # Flushing starts a new batch; rebind its contents and ID
+                batch_contents = self.batch_contents
+                batch_id = self.batch_id
+        # Insert remaining data (if any was added since the last flush)
+        if lookup_updates:
             self._process_batch(lookup_updates, True)
 
+    def _supports_transactions(self):
+        """
+        Checks whether the connected MongoDB deployment supports multi-document transactions.
+
+        Returns:
+            bool: True for replica sets and sharded clusters, False for standalone servers.
+        """
+        if self._transactions_supported is None:
+            topology = IndexTracking._get_db().client.topology_description
+            self._transactions_supported = topology.topology_type_name in (
+                "ReplicaSetWithPrimary",
+                "Sharded",
+            )
+        return self._transactions_supported
+
+    @contextmanager
+    def _write_session(self):
+        """
+        Yields a PyMongo session with an open transaction, or None on deployments
+        without transaction support (the writes then run as plain bulk writes).
+        """
+        if not self._supports_transactions():
+            yield None
+            return
+        with IndexTracking._get_db().client.start_session() as session:
+            with session.start_transaction():  # Commits on exit, aborts on error
+                yield session
+
     def _process_batch(self, lookup_updates, isPartialBatch=False):
         """
         Saves the current batch data, updates lookup entries, and manages batch state.
 
+        The batch data, lookup entries and the index tracking checkpoint are written in a
+        single transaction (when supported), so a checkpoint never points past stored data.
+
         Args:
             lookup_updates (list): A list of tuples containing (encoded_url, batch_id) for lookup updates.
             is_partial_batch (bool, optional): Indicates if this is a partial batch with fewer than `batch_size` entries. Defaults to False.
 
         Updates:
-            - Saves batch data to `CommonCrawlProcessed`.
+            - Saves the newly added webpages to `WebpageDoc`.
             - Updates `WebpageUrlLookup` lookup entries.
+            - Updates the `IndexTracking` checkpoint.
             - Manages `last_updated_batch_id`, `last_item_index`, and `last_batch` to keep track of batch processing state.
             - Calls `_append_last_batch_info()` to update the last processed batch.
         """
-        CommonCrawlProcessed.update_batch(self.batch_id, self.batch_contents)
-        WebpageUrlLookup.bulk_update_webpage_lookup(lookup_updates)
+        last_item_index = len(self.batch_contents) if isPartialBatch else 0
+        with self._write_session() as session:
+            # Only the pages added since the last flush are sent, not the whole batch
+            batch_contents = self.batch_contents
+            WebpageDoc.upsert_many(
+                self.batch_id,
+                {key: batch_contents[key] for key, _ in lookup_updates},
+                session=session,
+            )
+            WebpageUrlLookup.bulk_update_webpage_lookup(lookup_updates, session=session)
+            IndexTracking.update_last_processed(
+                self.batch_id, last_item_index, session=session
+            )
         # Update last batch info
         self.last_updated_batch_id = self.batch_id
-        self.last_item_index = len(self.batch_contents) if isPartialBatch else 0
+        self.last_item_index = last_item_index
         self.last_batch = self.batch_contents if isPartialBatch else {}
         pages_in_this_batch = self.last_item_index if isPartialBatch else 100
         print(f"Inserted batch {self.batch_id} with {pages_in_this_batch} webpages.")
@@ -139,14 +192,72 @@ class BatchProcessor:
 
         Args:
             data (dict): A mapping of batch IDs to dictionaries where each dictionary
-                        maps encoded URLs to WebpageData objects.
+                        maps encoded URLs to webpage data dicts.
         """
         for batch_id, webpages_update_map in data.items():
-            CommonCrawlProcessed.update_batch(batch_id, webpages_update_map)
+            WebpageDoc.update_batch(batch_id, webpages_update_map)
 
-    def insert_webpage_data(self, batch_contents: Dict[str, WebpageData]):
+    def _classify(self, batch_contents):
         """
-        Inserts structured webpage data into MongoDB in batches and updates the last batch index tracking.
+        Lazily classifies webpages based on their prior existence in the database.
+
+        Only the encoded URL keys are materialized (for the bulk lookup); page data is
+        converted to dictionary format one record at a time as it is yielded.
+
+        Args:
+            batch_contents (dict): A mapping of URLs (keys) to webpage data dicts (values).
+
+        Yields:
+            tuple: `("insert", encoded_url, page_data)` for new webpages, or
+            `("update", batch_id, encoded_url, page_data)` for already stored webpages.
+        """
+        encoded_urls = [url_key(url) for url in batch_contents]
+        # Fetch only the required fields and construct the lookup dictionary
+        existing_lookups = WebpageUrlLookup.bulk_data_lookup(encoded_urls)
+        for encoded_url, page_data in zip(encoded_urls, batch_contents.values()):
+            curr_batch_id = existing_lookups.get(encoded_url)
+            if curr_batch_id is None:
+                yield ("insert", encoded_url, WebpageData.to_bson_dict(page_data))
+            else:
+                yield (
+                    "update",
+                    curr_batch_id,
+                    encoded_url,
+                    WebpageData.to_bson_dict(page_data),
+                )
+
+    def _dispatch(self, classified, pending_updates):
+        """
+        Routes classified webpages to their write path in a single streaming pass.
+
+        New webpages are yielded as (encoded URL, page data) pairs for `_insert_batch`.
+        Updates are grouped per batch ID and flushed once a group reaches `batch_size`;
+        smaller groups are left in `pending_updates` for the caller to write.
+
+        Args:
+            classified (Iterable[tuple]): Entries produced by `_classify`.
+            pending_updates (dict): Batch ID -> {Encoded URL -> page data}, filled in place.
+
+        Yields:
+            tuple: (encoded URL, page data) pairs of webpages to insert.
+        """
+        for entry in classified:
+            if entry[0] == "insert":
+                yield entry[1], entry[2]
+                continue
+            _, curr_batch_id, encoded_url, page_data = entry
+            group = pending_updates.setdefault(curr_batch_id, {})
+            group[encoded_url] = page_data
+            if len(group) >= self.batch_size:
+                WebpageDoc.update_batch(
+                    curr_batch_id, pending_updates.pop(curr_batch_id)
+                )
+
+    def insert_webpage_data(self, batch_contents: Dict[str, dict]):
+        """
+        Inserts structured webpage data into MongoDB in batches.
+
+        The last batch index tracking is checkpointed together with every flushed batch.
 
         Args:
             batch_contents (dict): Dictionary where each key is a URL and value is webpage data.
@@ -155,43 +266,31 @@ class BatchProcessor:
             print("No webpage data to insert.")
             return
         self._insert_batch(
-            self.map_encoded_urls_to_data(batch_contents)
-        )  # Encode URLs as Base64 keys and convert corresponding page data into dictionary format
-        self.update_index_tracking()
+            self.map_encoded_urls_to_data(batch_contents).items()
+        )  # Hash URLs into keys and convert corresponding page data into dictionary format
 
-    def update_webpage_data(self, batch_contents: Dict[str, WebpageData]):
+    def update_webpage_data(self, batch_contents: Dict[str, dict]):
         """
         Updates webpage data in MongoDB by inserting new records and updating missing fields.
 
         - Inserts new webpages that are not yet in the database.
         - Updates existing webpages with missing fields.
         - Uses batch processing for efficient MongoDB updates.
+        - Classifies and writes in a single streaming pass, without building
+          intermediate copies of the whole input.
 
         Args:
-            batch_contents (dict): A mapping of URLs (keys) to WebpageData objects (values).
+            batch_contents (dict): A mapping of URLs (keys) to webpage data dicts (values).
         """
         if not batch_contents:
             print("No webpage data to insert.")
             return
-        new_contents = {}  # Encoded URL -> WebpageData (for new entries)
-        inserted_contents = {}  # Batch ID -> {Encoded URL -> WebpageData}
-        # Encode URLs as Base64 keys and convert corresponding page data into dictionary format
-        safe_url_map = self.map_encoded_urls_to_data(batch_contents)
-        # Fetch only the required fields and construct the lookup dictionary
-        existing_lookups = WebpageUrlLookup.bulk_data_lookup(safe_url_map.keys())
-        # Classify contents based on prior existence
-        for encoded_url, page_data in safe_url_map.items():
-            if encoded_url in existing_lookups:
-                curr_batch_id = existing_lookups[encoded_url]
-                if curr_batch_id not in inserted_contents:
-                    inserted_contents[curr_batch_id] = {}
-                inserted_contents[curr_batch_id][encoded_url] = page_data
-            else:
-                new_contents[encoded_url] = page_data
-        # Batch process missing webpages
-        if new_contents:
-            self._insert_batch(new_contents)
-        # Update existing webpages in batches
+        inserted_contents = {}  # Batch ID -> {Encoded URL -> page data}
+        # Insert missing webpages while streaming updates to existing ones
+        self._insert_batch(
+            self._dispatch(self._classify(batch_contents), inserted_contents)
+        )
+        # Update the remaining existing webpages in batches
         if inserted_contents:
             self._update_in_batches(inserted_contents)
 
@@ -202,46 +301,66 @@ class BatchProcessor:
         Returns:
             int: The last used `batch_id` (defaults to 0 if no batch exists).
         """
-        last_batch = CommonCrawlProcessed.objects.order_by("-batch_id").first()
-        return last_batch.batch_id if last_batch else 0  # Handle None case
+        # Project only the ID so no page data is transferred
+        last_batch = WebpageDoc._get_collection().find_one(
+            {}, {"batch_id": 1}, sort=[("batch_id", -1)]
+        )
+        return last_batch["batch_id"] if last_batch else 0  # Handle None case
 
     def count_documents(self):
         """
-        Returns the total number of stored batches.
+        Returns the exact number of stored batches by counting distinct batch IDs.
+
+        This is not O(1): the distinct walks the `batch_id` index once per call.
+        Callers that report progress often, or that only need the O(1) figure, must
+        use `estimated_batch_count` instead.
 
         Returns:
             int: The number of stored batches.
         """
-        return CommonCrawlProcessed.objects.count()
+        return len(WebpageDoc._get_collection().distinct("batch_id"))
+
+    def estimated_batch_count(self):
+        """
+        Estimates the number of stored batches from the highest batch ID.
 
-    def update_index_tracking(self):
+        Batch IDs are assigned sequentially from 1, so the highest ID is read from the
+        `batch_id` index instead of scanning; gaps left by failed or deleted batches
+        make it an overestimate, so use `count_documents` when they matter.
+
+        Returns:
+            int: The estimated number of stored batches.
+        """
+        return self.get_last_batch_id()
+
+    def update_index_tracking(self, session=None):
         """
         Updates the last processed batch index in MongoDB.
+
+        Args:
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
         """
         # Perform an atomic update or create new entry if it doesn't exist
-        IndexTracking.objects(_id="last_processed_index").modify(
-            upsert=True,
-            set__last_batch_id=self.last_updated_batch_id,
-            set__last_item_index=self.last_item_index,
-            set__updated_at=datetime.now(timezone.utc),  # Auto-update timestamp
+        IndexTracking.update_last_processed(
+            self.last_updated_batch_id, self.last_item_index, session=session
         )
 
-    def get_base64_encoded(self, url: str):
-        return base64.urlsafe_b64encode(url.encode()).decode()
+    def get_url_key(self, url: str):
+        return url_key(url)
 
-    def map_encoded_urls_to_data(self, batch_contents) -> Dict[str, WebpageData]:
+    def map_encoded_urls_to_data(self, batch_contents) -> Dict[str, dict]:
         """
-        Converts a batch of webpage data into a dictionary where URLs are encoded
-        in Base64 as keys and their corresponding page data is stored in dictionary format.
+        Converts a batch of webpage data into a dictionary where URLs are hashed
+        into keys and their corresponding page data is stored in dictionary format.
 
         Args:
-            batch_contents (Dict[str, WebpageData]): A dictionary mapping URLs to their respective webpage data.
+            batch_contents (Dict[str, dict]): A dictionary mapping URLs to their respective webpage data.
 
         Returns:
-            Dict[str, WebpageData]: A dictionary with Base64-encoded URLs as keys and page data in dictionary format.
+            Dict[str, dict]: A dictionary with hashed URL keys and page data in dictionary format.
         """
         return {
-            self.get_base64_encoded(url): WebpageData.to_dict(page_data)
+            url_key(url): WebpageData.to_bson_dict(page_data)
             for url, page_data in batch_contents.items()
         }
     
@@ -250,7 +369,7 @@ class BatchProcessor:
     ## batch_processor = BatchProcessor()
     ## IndexTracking.objects.delete()
     ## WebpageUrlLookup.objects.delete()
-    ## CommonCrawlProcessed.objects.delete()
+    ## WebpageDoc.objects.delete()
     # # Print batch processer's initialized values
     # print(vars(batch_processor))
     # test_batch_contents = {}
@@ -1,11 +1,40 @@
-import json
 import boto3
+import orjson
+import os
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from enum import Enum
-from warcio.archiveiterator import ArchiveIterator
+from itertools import islice
+from queue import Queue
+from threading import Thread
+from fastwarc.stream_io import GZipStream
+from fastwarc.warc import ArchiveIterator, WarcRecordType
 from .batch_processor import BatchProcessor
-from .data_schemas.common_crawl_processed_schema import WebpageData
 from .html_parser import HTMLParser
 
+# Where S3 key listings are cached unless a directory is passed in
+DEFAULT_KEY_CACHE_DIR = os.getenv(
+    "CC_KEY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "surf_shelter")
+)
+
+
+def _extract_wat_fields(wat_data):
+    """
+    Returns (url, title, raw links, HTML content) from a parsed WAT record.
+
+    Each nested section is indexed once; raises KeyError if a required one is missing.
+    """
+    envelope = wat_data["Envelope"]
+    response_metadata = envelope["Payload-Metadata"]["HTTP-Response-Metadata"]
+    html_metadata = response_metadata["HTML-Metadata"]
+    html = response_metadata.get("HTML")
+    return (
+        envelope["WARC-Header-Metadata"]["WARC-Target-URI"],
+        html_metadata["Head"]["Title"],
+        html_metadata["Links"],
+        html.get("Content", "") if html else "",
+    )
+
 
 class RawFileType(Enum):
     WAT_FILE = 1
@@ -16,17 +45,30 @@ class CommonCrawlProcessor:
     """Processes Common Crawl WARC and WAT data from AWS S3."""
 
     def __init__(
-        self, aws_user_access_key, aws_user_secret_key, crawl_id="CC-MAIN-2025-05"
+        self,
+        aws_user_access_key,
+        aws_user_secret_key,
+        crawl_id="CC-MAIN-2025-05",
+        key_cache_dir=None,
     ):
-        """Initializes the AWS S3 client and sets up batch processing."""
+        """
+        Initializes the AWS S3 client and sets up batch processing.
+
+        S3 key listings are cached under `key_cache_dir`, which defaults to the
+        `CC_KEY_CACHE_DIR` environment variable or `~/.cache/surf_shelter`.
+        """
         if not aws_user_access_key or not aws_user_secret_key:
             raise ValueError(
                 "AWS credentials missing! Provide access key & secret key."
             )
+        self.max_workers = 16  # Number of files fetched and parsed concurrently
         self.s3_client = boto3.client(
             "s3",
             aws_access_key_id=aws_user_access_key,
             aws_secret_access_key=aws_user_secret_key,
+            # Keep one pooled connection per worker thread (the client is thread-safe),
+            # with TCP keepalive so idle connections are reused instead of re-handshaked
+            config=Config(max_pool_connections=self.max_workers, tcp_keepalive=True),
         )
         self.bucket_name = "commoncrawl"
         self.crawl_id = crawl_id
@@ -34,25 +76,77 @@ class CommonCrawlProcessor:
         self.raw_file_type = None
         self.file_processing_limit = 10000  # Limit the number of WARC/WAT files processed to prevent database storage overflow
         self.gz_records_limit = 10  # Limit the number of records processed per gzipped file to improve processing diversity
+        self.write_buffer_size = 1000  # Pages accumulated across files before a MongoDB write
+        self.pending_page_data = {}  # Pages waiting for the next buffered write
+        self.key_cache_dir = key_cache_dir or DEFAULT_KEY_CACHE_DIR
+        self._s3_keys = {}  # Listed keys per segment subdirectory, loaded lazily
+        self.write_queue = Queue(maxsize=2)  # (file type, pages) awaiting a write
+        self._write_error = None  # First failed write, re-raised on the caller's thread
+        # A single writer thread applies buffered writes while extraction continues
+        Thread(target=self._write_worker, daemon=True).start()
 
-    def list_warc_files(self):
-        """Lists up to 10000 WARC file names from AWS S3 using pagination."""
+    def _list_segment_keys(self, subdir, suffix):
+        """
+        Lists up to `file_processing_limit` keys ending in `suffix` from the
+        `subdir/` prefix of each crawl segment, in S3 key order.
+
+        Segments are listed one level deep first, so only their `subdir/` objects
+        are paginated and listing stops as soon as the limit is reached.
+        """
+        keys = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
         prefix = f"crawl-data/{self.crawl_id}/segments/"  # Search in segments
-        warc_files = []
-        try:
-            paginator = self.s3_client.get_paginator("list_objects_v2")
-            pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
-            for page in pages:
-                if "Contents" in page:
-                    # Filter only .warc.gz files and add to list
-                    warc_files.extend(
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, Delimiter="/"
+        ):
+            for segment in page.get("CommonPrefixes", []):
+                for key_page in paginator.paginate(
+                    Bucket=self.bucket_name, Prefix=f"{segment['Prefix']}{subdir}/"
+                ):
+                    keys.extend(
                         obj["Key"]
-                        for obj in page["Contents"]
-                        if obj["Key"].endswith(".warc.gz")
+                        for obj in key_page.get("Contents", [])
+                        if obj["Key"].endswith(suffix)
                     )
-                if len(warc_files) >= self.file_processing_limit:
-                    break
-            warc_files = warc_files[: self.file_processing_limit]
+                    if len(keys) >= self.file_processing_limit:
+                        return keys[: self.file_processing_limit]
+        return keys
+
+    def _cached_keys(self, subdir, suffix):
+        """
+        Returns the keys of `_list_segment_keys`, cached on disk across runs.
+
+        A published crawl never changes, so the cache file is keyed by crawl ID,
+        subdirectory and limit; raising the limit lists the keys afresh. An empty
+        listing (a wrong crawl ID or a transient S3 error) is never cached.
+        """
+        if self._s3_keys.get(subdir):
+            return self._s3_keys[subdir]
+        cache_path = os.path.join(
+            self.key_cache_dir,
+            f"cc_keys_{self.crawl_id}_{subdir}_{self.file_processing_limit}.txt",
+        )
+        keys = []
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                keys = f.read().splitlines()
+        if not keys:  # No cache, or an empty one left by an older run: list again
+            keys = self._list_segment_keys(subdir, suffix)
+            if not keys:
+                return keys
+            os.makedirs(self.key_cache_dir, exist_ok=True)
+            # Write a temporary file first so an interrupted run leaves no partial index
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(keys))
+            os.replace(tmp_path, cache_path)
+        self._s3_keys[subdir] = keys
+        return keys
+
+    def list_warc_files(self):
+        """Lists up to 10000 WARC file names from the cached S3 key index."""
+        try:
+            warc_files = self._cached_keys("warc", ".warc.gz")
             print(f"First 3: {warc_files[:3]} ...")
             return warc_files
         except Exception as e:
@@ -60,150 +154,139 @@ class CommonCrawlProcessor:
             return []
 
     def list_wat_files(self):
-        """Lists up to 10000 WAT file names from AWS S3 using pagination."""
-        prefix = f"crawl-data/{self.crawl_id}/segments/"
-        wat_files = []
+        """Lists up to 10000 WAT file names from the cached S3 key index."""
         try:
-            paginator = self.s3_client.get_paginator("list_objects_v2")
-            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
-                if "Contents" in page:
-                    for obj in page["Contents"]:
-                        if "wat/" in obj["Key"] and obj["Key"].endswith(".wat.gz"):
-                            wat_files.append(obj["Key"])
-                            if len(wat_files) >= self.file_processing_limit:
-                                print(f"First 3: {wat_files[:3]} ...")
-                                return wat_files
+            wat_files = self._cached_keys("wat", ".wat.gz")
+            print(f"First 3: {wat_files[:3]} ...")
+            return wat_files
         except Exception as e:
             print(f"Error fetching WAT file list: {e}")
-        return wat_files
+            return []
+
+    def _iter_archive_records(self, raw_file, record_type, parse_http=True):
+        """
+        Streams the records of a gzipped WARC/WAT file directly from S3.
+
+        The object is inflated incrementally, so only the prefix needed to reach
+        `gz_records_limit` records is ever downloaded. Records of other types are
+        skipped by fastwarc's C++ parser without creating Python objects.
+        Raises the underlying error if the object cannot be fetched.
+        """
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=raw_file)
+        return ArchiveIterator(
+            GZipStream(response["Body"]),
+            record_types=record_type,
+            parse_http=parse_http,
+            auto_decode="all",  # Undo chunked/content encodings of HTTP bodies
+        )
 
     def extract_warc_data(self, warc_file, page_data):
         """Extracts webpage content, HTML, and scripts from a WARC file.
         Returns empty data if html content, embeddedScripts or externalScripts are not found.
         """
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=warc_file)
-            stream = response["Body"]
+            records = self._iter_archive_records(warc_file, WarcRecordType.response)
         except Exception as e:
             print(f"Error fetching WARC file {warc_file}: {e}")
             return {}  # Return empty page_data on error
 
-        processed_count = 0  # Initialize a counter for processed records
-        for record in ArchiveIterator(stream):
-            if processed_count >= self.gz_records_limit:
-                break
-            if record.rec_type == "response":
-                url = record.rec_headers.get_header("WARC-Target-URI")
-                content_type = (
-                    record.http_headers.get_header("Content-Type")
-                    if record.http_headers
-                    else None
-                )
-                if url and content_type and "text/html" in content_type:
-                    try:
-                        html_content = (
-                            record.content_stream()
-                            .read()
-                            .decode("utf-8", errors="ignore")
-                        )
-                        parser = HTMLParser(html_content)
-                        parsed_data = parser.get_scripts()
-                        # Extract required fields
-                        embedded_scripts = parsed_data.get("embedded_scripts", [])
-                        external_scripts = parsed_data.get("external_scripts", [])
-
-                        # Check if all required fields have data
-                        if (
-                            not html_content
-                            or not embedded_scripts
-                            or not external_scripts
-                        ):
-                            continue  # Skip this record
-
-                        page_data[url] = {
-                            "url": url,
-                            "html": html_content,
-                            "embeddedScripts": embedded_scripts,
-                            "externalScripts": external_scripts,
-                        }
-                        processed_count += 1  # Count successfully processed records.
-                    except (
-                        UnicodeDecodeError,
-                        AttributeError,
-                        TypeError,
-                        Exception,
-                    ) as e:
-                        print(f"Error processing WARC record for {url}: {e}")
-                        continue  # Skip to the next record on error
+        # islice stops pulling records once enough pages have been extracted
+        page_data.update(
+            islice(self._iter_warc_pages(records), self.gz_records_limit)
+        )
         return page_data
 
+    def _iter_warc_pages(self, records):
+        """Yields (url, page data) for WARC response records with HTML and scripts."""
+        for record in records:
+            url = record.headers.get("WARC-Target-URI")
+            content_type = (
+                record.http_headers.get("Content-Type") if record.http_headers else None
+            )
+            if url and content_type and "text/html" in content_type:
+                try:
+                    raw_html = record.reader.read()
+                    # Cheap byte scan: pages without a script tag are skipped undecoded
+                    if b"<script" not in raw_html and b"<SCRIPT" not in raw_html:
+                        continue
+                    # lexbor parses the raw bytes; no str copy is made for rejected pages
+                    parsed_data = HTMLParser.extract_scripts(raw_html)
+                    # Extract required fields
+                    embedded_scripts = parsed_data.get("embedded_scripts", [])
+                    external_scripts = parsed_data.get("external_scripts", [])
+
+                    # Check if all required fields have data
+                    if not embedded_scripts or not external_scripts:
+                        continue  # Skip this record
+                    # Decode only the pages that are kept, for storage
+                    html_content = raw_html.decode("utf-8", errors="ignore")
+
+                    yield url, {
+                        "url": url,
+                        "html": html_content,
+                        "embeddedScripts": embedded_scripts,
+                        "externalScripts": external_scripts,
+                    }
+                except (
+                    UnicodeDecodeError,
+                    AttributeError,
+                    TypeError,
+                    Exception,
+                ) as e:
+                    print(f"Error processing WARC record for {url}: {e}")
+                    continue  # Skip to the next record on error
+
     def extract_wat_data(self, wat_file, page_data):
         """Extracts metadata from a WAT file and updates or creates webpage data entries.
         Returns empty data if title or links are not found.
         """
         try:
-            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=wat_file)
-            stream = response["Body"]
+            records = self._iter_archive_records(
+                wat_file, WarcRecordType.metadata, parse_http=False
+            )
         except Exception as e:
             print(f"Error fetching WAT file {wat_file}: {e}")
             return {}  # Return empty page_data on error
 
-        processed_count = 0  # Initialize a counter for processed records
-        for record in ArchiveIterator(stream):
-            if processed_count >= self.gz_records_limit:
-                break
-            if record.rec_type == "metadata":
-                try:
-                    wat_data = json.loads(
-                        record.content_stream().read().decode("utf-8")
-                    )
-                    envelope = wat_data.get("Envelope", {})
-                    header_metadata = envelope.get("WARC-Header-Metadata", {})
-                    payload_metadata = envelope.get("Payload-Metadata", {})
-                    http_response_metadata = payload_metadata.get(
-                        "HTTP-Response-Metadata", {}
-                    )
-                    html_metadata = http_response_metadata.get("HTML-Metadata", {})
-                    head = html_metadata.get("Head", {})
-
-                    url = header_metadata.get("WARC-Target-URI")
-                    if not url:
-                        continue  # Skip if URL is missing
-
-                    title = head.get("Title", "")
-                    links = [
-                        link["url"]
-                        for link in html_metadata.get("Links", [])
-                        if "url" in link
-                    ][
-                        :3
-                    ]  # Limit to 3
-
-                    # Extract HTML content
-                    html_content = http_response_metadata.get("HTML", {}).get(
-                        "Content", ""
-                    )
-                    # Check if title and links is available
-                    if not title or not links:
-                        continue  # Skip this record
-                    page_data[url] = {
-                        "url": url,
-                        "html": html_content,
-                        "title": title,
-                        "links": links,
-                    }
-                    processed_count += 1  # Count successfully processed records.
-                except (json.JSONDecodeError, TypeError, KeyError) as e:
-                    print(f"Skipping malformed JSON in {wat_file}")
+        # islice stops pulling records once enough pages have been extracted
+        page_data.update(
+            islice(self._iter_wat_pages(records, wat_file), self.gz_records_limit)
+        )
         return page_data
 
+    def _iter_wat_pages(self, records, wat_file):
+        """Yields (url, page data) for WAT metadata records with a title and links."""
+        for record in records:
+            try:
+                # orjson parses (and validates UTF-8 in) the raw bytes directly
+                wat_data = orjson.loads(record.reader.read())
+                try:
+                    url, title, links_raw, html_content = _extract_wat_fields(wat_data)
+                except KeyError:
+                    continue  # Skip records without a URL, title or links
+                # Stop after the first 3 links instead of collecting them all
+                links = list(
+                    islice((link["url"] for link in links_raw if "url" in link), 3)
+                )
+                # Check if URL, title and links are available
+                if not url or not title or not links:
+                    continue  # Skip this record
+                yield url, {
+                    "url": url,
+                    "html": html_content,
+                    "title": title,
+                    "links": links,
+                }
+            except (orjson.JSONDecodeError, TypeError, KeyError) as e:
+                print(f"Skipping malformed JSON in {wat_file}")
+
     def store_batch_in_mongodb(self, page_data):
         """
         Stores extracted webpage data in MongoDB using structured batch format.
 
-        This function processes webpage data in batches and inserts or updates the database
-        depending on the raw file type (WAT or WARC). It ensures that batch processing is efficient
-        and that only valid data is stored.
+        Pages are buffered across files and written once at least `write_buffer_size`
+        pages are pending, so each bulk write carries enough operations to amortize
+        the network round-trip. Call `flush_pending_pages` to write the remainder.
 
         Args:
             page_data (dict): A dictionary where keys are URLs and values are webpage data.
@@ -216,25 +299,69 @@ class CommonCrawlProcessor:
         if not page_data:
             print("No valid webpage data to store in MongoDB.")
             return
-        batch_contents = {}  # Temporary storage for batch processing
-        for url, data in page_data.items():
-            # Convert data dictionary to WebpageData instance
-            batch_contents[url] = WebpageData.to_webpage_data(data)
-            # Check if batch size limit is reached
-            if len(batch_contents) >= self.batch_processor.batch_size:
-                # Store batch based on file type (WAT files are inserted, WARC files are updated)
-                if self.raw_file_type == RawFileType.WAT_FILE:
-                    self.batch_processor.insert_webpage_data(batch_contents)
-                elif self.raw_file_type == RawFileType.WARC_FILE:
-                    self.batch_processor.update_webpage_data(batch_contents)
-                # Clear batch_contents after storing to prepare for the next batch
-                batch_contents.clear()
-        # Store any remaining data that didn't reach batch size limit
-        if batch_contents:
-            self.batch_processor.insert_webpage_data(batch_contents)
+        # Buffer the raw dicts; they are written without ORM validation
+        self.pending_page_data.update(page_data)
+        if len(self.pending_page_data) >= self.write_buffer_size:
+            self.flush_pending_pages()
+
+    def _write_worker(self):
+        """
+        Applies queued page buffers to MongoDB on a background thread.
+
+        WAT pages are inserted and WARC pages are updated; the BatchProcessor splits
+        them into `batch_size` batches. Writes run one at a time, in queue order.
+        The first failure is kept and re-raised by `flush_pending_pages` or
+        `wait_for_writes`, so a failed write is never silently dropped.
+        """
+        while True:
+            raw_file_type, page_data = self.write_queue.get()
+            try:
+                if raw_file_type == RawFileType.WAT_FILE:
+                    self.batch_processor.insert_webpage_data(page_data)
+                elif raw_file_type == RawFileType.WARC_FILE:
+                    self.batch_processor.update_webpage_data(page_data)
+            except Exception as e:
+                print(f"Error writing webpage data to MongoDB: {e}")
+                if self._write_error is None:
+                    self._write_error = e
+            finally:
+                self.write_queue.task_done()
+
+    def flush_pending_pages(self):
+        """
+        Hands all buffered webpage data to the writer thread.
+
+        Only blocks if two writes are already waiting, so S3 fetches overlap with
+        MongoDB acknowledgements. Call `wait_for_writes` to wait for completion.
+        Raises the first error of an earlier background write, if any.
+        """
+        self._raise_write_error()
+        if not self.pending_page_data:
+            return
+        self.write_queue.put((self.raw_file_type, self.pending_page_data))
+        self.pending_page_data = {}
+
+    def wait_for_writes(self):
+        """
+        Blocks until every queued write has been applied to MongoDB.
+
+        Raises the first error of a failed background write, if any.
+        """
+        self.write_queue.join()
+        self._raise_write_error()
+
+    def _raise_write_error(self):
+        """Re-raises (and clears) the first error recorded by the writer thread."""
+        error, self._write_error = self._write_error, None
+        if error is not None:
+            raise error
 
     def process_webpage_data(self, raw_file):
-        """Processes WARC and WAT files together, extracting HTML, scripts, metadata."""
+        """Extracts HTML, scripts or metadata from a WARC or WAT file.
+
+        Returns the extracted page data, or None if nothing complete was found.
+        Storing is left to the caller so that files can be extracted concurrently.
+        """
         print(f"Processing: {raw_file} of type {self.raw_file_type}")
         try:
             if self.raw_file_type == RawFileType.WAT_FILE:
@@ -243,30 +370,46 @@ class CommonCrawlProcessor:
                 page_data = self.extract_warc_data(raw_file, {})
             else:
                 print(f"Error: Unknown file type {self.raw_file_type}")
-                return
+                return None
         except Exception as e:
             print(f"Error processing {raw_file}: {e}")  # Catches extraction errors
-            return
+            return None
         if not page_data:  # Only checks if the dictionary is empty
             print("No complete data found")
-            return
-        self.store_batch_in_mongodb(page_data)
-        print("Finished processing...")
+            return None
+        return page_data
+
+    def _process_files_concurrently(self, raw_files):
+        """
+        Fetches and extracts files on a thread pool to overlap S3 I/O and decompression,
+        storing each result from the calling thread so MongoDB batching stays sequential.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self.process_webpage_data, raw_file)
+                for raw_file in raw_files
+            ]
+            for future in as_completed(futures):
+                page_data = future.result()
+                if page_data:
+                    self.store_batch_in_mongodb(page_data)
+                    print("Finished processing...")
+        # Write whatever is still buffered for this file type, then drain the queue
+        self.flush_pending_pages()
+        self.wait_for_writes()
 
     def process_wat_files_in_range(self, start_idx=0, end_idx=5):
         """Processes a range of WAT file in pairs."""
         wat_files = self.list_wat_files()[start_idx:end_idx]
         self.raw_file_type = RawFileType.WAT_FILE
-        for wat_file in wat_files:
-            self.process_webpage_data(wat_file)
+        self._process_files_concurrently(wat_files)
         print(f"Processed WAT files {start_idx} to {end_idx}")
 
     def process_warc_files_in_range(self, start_idx=0, end_idx=5):
         """Processes a range of WARC file in pairs."""
         warc_files = self.list_warc_files()[start_idx:end_idx]
         self.raw_file_type = RawFileType.WARC_FILE
-        for warc_file in warc_files:
-            self.process_webpage_data(warc_file)
+        self._process_files_concurrently(warc_files)
         print(f"Processed WARC files {start_idx} to {end_idx}")
 
 
@@ -278,9 +421,9 @@ class CommonCrawlProcessor:
 #     )
 #     processor.process_wat_files_in_range(0, 500)
 #     print(
-#         f"Total webpage batches stored in MongoDB: {processor.batch_processor.count_documents()}"
+#         f"Total webpage batches stored in MongoDB: {processor.batch_processor.estimated_batch_count()}"
 #     )
 #     processor.process_warc_files_in_range(0, 650)
 #     print(
-#         f"Total webpage batches stored in MongoDB: {processor.batch_processor.count_documents()}"
+#         f"Total webpage batches stored in MongoDB: {processor.batch_processor.estimated_batch_count()}"
 #     )
\ No newline at end of file
@@ -1,11 +1,128 @@
 import mongoengine as meObj
 import os
+import xxhash
+import zstandard
+from bson import Binary
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from typing import List, Tuple, Dict
 from datetime import datetime, timezone
 
+
+def get_connection():
+    """
+    Returns the shared MongoDB client, connecting MongoEngine on first use only.
+
+    The client keeps a connection pool sized for concurrent bulk writes and
+    negotiates wire compression, which shrinks the HTML-heavy write payloads.
+    """
+    try:
+        return meObj.get_connection()  # Reuse the pooled client if already connected
+    except meObj.ConnectionFailure:
+        return meObj.connect(
+            db=os.getenv("COLLECTION_ID"),
+            host=os.getenv("MONGO_URL"),
+            maxPoolSize=200,
+            minPoolSize=20,
+            compressors="zstd,zlib",  # zstd when the server supports it, else zlib
+            retryWrites=True,
+            appname="cc-trainer",
+        )
+
+
 # Connect to MongoDB
-meObj.connect(db=os.getenv("COLLECTION_ID"), host=os.getenv("MONGO_URL"))
+get_connection()
+
+
+# Field names of a stored webpage, in storage order
+WEBPAGE_FIELDS = (
+    "url",
+    "html",
+    "embeddedScripts",
+    "externalScripts",
+    "title",
+    "links",
+    "headers",
+)
+
+# Operations sent per bulk_write on the lookup table (well under the 16MB/100k caps)
+LOOKUP_BULK_CHUNK_SIZE = 500
+# Concurrent lookup bulk_writes (kept well below the client's maxPoolSize)
+LOOKUP_BULK_WORKERS = 8
+
+# zstd level for stored HTML (fast, and HTML typically shrinks 5-10x)
+HTML_COMPRESSION_LEVEL = 3
+
+
+def compress_html(html: str) -> Binary:
+    """Compresses HTML text into zstd BinData for storage."""
+    return Binary(zstandard.compress(html.encode("utf-8"), HTML_COMPRESSION_LEVEL))
+
+
+def decompress_html(value) -> str:
+    """Restores stored HTML; legacy uncompressed strings are returned unchanged."""
+    if isinstance(value, (bytes, Binary)):
+        return zstandard.decompress(value).decode("utf-8")
+    return value
+
+
+class HtmlField(meObj.BinaryField):
+    """Stores HTML as zstd-compressed BinData and exposes it as text."""
+
+    def to_python(self, value):
+        return decompress_html(value)
+
+    def to_mongo(self, value):
+        return compress_html(value) if isinstance(value, str) else Binary(value)
+
+    def validate(self, value):
+        if not isinstance(value, str):
+            super().validate(value)
+
+
+def url_key(url: str) -> str:
+    """
+    Hashes a URL into the fixed-length key used for webpage documents and lookups.
+
+    The full URL is kept in the stored page data, so the key only needs to be unique.
+
+    Args:
+        url (str): The URL to hash.
+
+    Returns:
+        str: The 16-character hex xxh64 digest of the UTF-8 bytes of `url`.
+    """
+    return xxhash.xxh64_hexdigest(url.encode())
+
+
+# Server error code for a duplicate key on a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+
+def safe_bulk_write(collection, operations, session=None, **kwargs):
+    """
+    Runs an unordered `bulk_write`, re-sending upserts that lost a duplicate-key race.
+
+    When concurrent writers upsert the same unique key, all but one fail with error
+    11000; sent again, those upserts match the now-existing document and update it.
+    Operations that succeeded are never re-sent. Other write errors, and any error
+    inside a transaction (which the server has already aborted), are raised.
+    """
+    try:
+        return collection.bulk_write(
+            operations, ordered=False, session=session, **kwargs
+        )
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        if session is not None or any(
+            error["code"] != DUPLICATE_KEY_ERROR for error in write_errors
+        ):
+            raise
+        retry_operations = [operations[error["index"]] for error in write_errors]
+        return collection.bulk_write(
+            retry_operations, ordered=False, session=session, **kwargs
+        )
 
 
 # Define the Webpage Data Schema
@@ -13,7 +130,7 @@ class WebpageData(meObj.EmbeddedDocument):
     """Represents a single webpage's extracted data."""
 
     url = meObj.StringField(required=True)  # Unique within its batch
-    html = meObj.StringField()  # Full HTML content of the webpage
+    html = HtmlField()  # Full HTML content of the webpage (zstd-compressed)
     embeddedScripts = meObj.ListField(meObj.StringField())  # Inline JavaScript
     externalScripts = meObj.ListField(
         meObj.StringField()
@@ -31,20 +148,31 @@ class WebpageData(meObj.EmbeddedDocument):
         Returns:
             dict: A dictionary representation of the webpage data without None values.
         """
+        # Single pass over the field names; no intermediate dict is built
         return {
             key: value
-            for key, value in {
-                "url": self.url,
-                "html": self.html,
-                "embeddedScripts": self.embeddedScripts,
-                "externalScripts": self.externalScripts,
-                "title": self.title,
-                "links": self.links,
-                "headers": self.headers,
-            }.items()
+            for key, value in zip(WEBPAGE_FIELDS, map(self._data.get, WEBPAGE_FIELDS))
             if value is not None
         }
 
+    @staticmethod
+    def to_bson_dict(data) -> dict:
+        """
+        Converts webpage data to a plain BSON-ready dict, removing fields that are None.
+
+        Raw dicts are filtered directly without constructing (and validating) an
+        EmbeddedDocument, so the write path never touches MongoEngine.
+
+        Args:
+            data (dict | WebpageData): Webpage data as a dict or WebpageData instance.
+
+        Returns:
+            dict: A dictionary representation of the webpage data without None values.
+        """
+        if isinstance(data, WebpageData):
+            return data.to_dict()
+        return {key: value for key, value in data.items() if value is not None}
+
     def to_webpage_data(data):
         """
         Converts a dictionary to a WebpageData instance.
@@ -58,9 +186,39 @@ class WebpageData(meObj.EmbeddedDocument):
         return WebpageData(**data)
 
 
+def _page_update(page_data) -> Tuple[dict, dict]:
+    """
+    Builds the `$set` and `$addToSet` fields for one webpage document.
+
+    Scalar fields are set; list fields are merged server-side with `$addToSet`/`$each`,
+    so only the new values need to be stored and duplicates are dropped. Null and
+    empty values are skipped, so fields already stored are never cleared.
+    Accepts webpage data dicts as well as `WebpageData` objects.
+
+    Returns:
+        Tuple[dict, dict]: The `$set` fields and the `$addToSet` fields.
+    """
+    set_fields, add_to_set_fields = {}, {}
+    for key, value in WebpageData.to_bson_dict(page_data).items():
+        if isinstance(value, (list, set)):
+            if value:  # Skip empty list updates
+                add_to_set_fields[key] = {"$each": list(value)}
+            continue
+        if isinstance(value, dict) and not value:
+            continue  # Skip empty object updates
+        if key == "html" and isinstance(value, str):
+            value = compress_html(value)  # Same encoding as HtmlField
+        set_fields[key] = value
+    return set_fields, add_to_set_fields
+
+
 # Define the Common Crawl Processed Schema
 class CommonCrawlProcessed(meObj.Document):
-    """Schema for storing processed Common Crawl data in MongoDB."""
+    """
+    Legacy schema storing a whole batch of webpages in one document.
+
+    New webpages are written to `WebpageDoc`; this class is kept to read older batches.
+    """
 
     batch_id = meObj.IntField(required=True, unique=True)  # Unique batch identifier
     contents = meObj.MapField(
@@ -68,61 +226,148 @@ class CommonCrawlProcessed(meObj.Document):
     )  # Store webpages as a Dict (URL -> WebpageData)
     meta = {"collection": "webpages"}
 
+
+# Define the per-webpage schema
+class WebpageDoc(meObj.Document):
+    """
+    Schema storing each processed webpage as its own document, grouped by `batch_id`.
+
+    Updating a page touches only that page's small document, and batches can grow
+    without approaching the 16MB BSON document limit.
+    """
+
+    id = meObj.StringField(primary_key=True)  # xxh64 hex key of the URL
+    batch_id = meObj.IntField(required=True)  # The batch the webpage belongs to
+    url = meObj.StringField(required=True)
+    html = HtmlField()  # Full HTML content of the webpage (zstd-compressed)
+    embeddedScripts = meObj.ListField(meObj.StringField())  # Inline JavaScript
+    externalScripts = meObj.ListField(
+        meObj.StringField()
+    )  # External JavaScript sources (URLs)
+    title = meObj.StringField()  # Title of the webpage (from <title> tag)
+    links = meObj.ListField(
+        meObj.StringField()
+    )  # Outbound links present in the webpage
+    headers = meObj.ListField(meObj.StringField())  # Script references (headers)
+    meta = {"collection": "webpage_docs", "indexes": [("batch_id", "id")]}
+
+    @classmethod
+    def _bulk_upsert(
+        cls, batch_id, pages, batch_operator, session=None, fields_operator="$set"
+    ):
+        """
+        Upserts one document per webpage with a single unordered `bulk_write`.
+
+        Args:
+            batch_id (int): The batch identifier written with each webpage.
+            pages (dict): A mapping of encoded URLs (keys) to webpage data dicts.
+            batch_operator (str): `"$set"` to (re)assign the batch, or `"$setOnInsert"`
+                                  to keep the batch of webpages that already exist.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
+            fields_operator (str, optional): `"$set"` to merge the page fields into
+                                             existing webpages, or `"$setOnInsert"`
+                                             to write them only for new webpages.
+                                             Defaults to "$set".
+        """
+        bulk_operations = []
+        for encoded_url, page_data in pages.items():
+            try:
+                set_fields, add_to_set_fields = _page_update(page_data)
+            except (TypeError, ValueError, AttributeError) as e:
+                print(f"Error processing {encoded_url}: {e}")
+                continue
+            if fields_operator == "$setOnInsert":
+                # Whole lists are written on insert; there is nothing to merge into
+                for key, values in add_to_set_fields.items():
+                    set_fields[key] = values["$each"]
+                add_to_set_fields = {}
+            update = {batch_operator: {"batch_id": batch_id}}
+            if set_fields:
+                # Page fields join the batch_id's operator when both are the same
+                update.setdefault(fields_operator, {}).update(set_fields)
+            if add_to_set_fields:
+                update["$addToSet"] = add_to_set_fields
+            bulk_operations.append(UpdateOne({"_id": encoded_url}, update, upsert=True))
+        if bulk_operations:
+            safe_bulk_write(cls._get_collection(), bulk_operations, session=session)
+
     @classmethod
-    def update_batch(cls, batch_id, webpages_update_map):
+    def update_batch(cls, batch_id, webpages_update_map, session=None):
         """
         Inserts or updates multiple webpage records in a given batch, preserving existing fields.
 
         This method:
-        - Creates a new batch if it does not exist.
         - Updates existing webpage data while retaining unchanged fields.
-        - Adds new webpages if they are not already present in the batch.
-        - Ensures data consistency by using MongoDB atomic operations.
+        - Adds new webpages to `batch_id` if they are not stored yet; webpages that
+          already exist keep their batch.
+        - Sends one unordered `bulk_write` with a partial `$set`/`$addToSet` per webpage.
 
         Args:
             batch_id (int): Unique identifier for the batch in which webpages are stored.
-            webpages_update_map (dict): A mapping of encoded URLs (keys) to `WebpageData` objects (values).
-                                        Each entry represents a webpage to be updated or inserted.
+            webpages_update_map (dict): A mapping of encoded URLs (keys) to webpage data dicts
+                                        (or `WebpageData` objects). Each entry represents a
+                                        webpage to be updated or inserted.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
+        """
+        cls._bulk_upsert(batch_id, webpages_update_map, "$setOnInsert", session)
 
-        Returns:
-            dict: The updated batch contents with the modified or newly added webpage data.
-        """
-        # Fetch batch or create a new one
-        batch = cls.objects(batch_id=batch_id).first()
-        if not batch:
-            batch = cls(batch_id=batch_id, contents={})  # Create new batch
-        # Loop through all the pages in the map
-        for encoded_url, page_data in webpages_update_map.items():
-            try:
-                # Ensure page_data is a WebpageData instance
-                if not isinstance(page_data, WebpageData):
-                    page_data = WebpageData.to_webpage_data(
-                        page_data
-                    )  # Convert dict to WebpageData instance
-                if encoded_url in batch.contents:
-                    # Merge existing fields instead of overwriting
-                    existing_data = batch.contents[encoded_url].to_mongo()
-                    new_data = page_data.to_mongo()
-                    # Update only the non-null values
-                    for key, value in new_data.items():
-                        if isinstance(value, (list, dict, set)) and not value:
-                            continue  # Skip empty object updates
-                        if (
-                            value is not None and key != "url"
-                        ):  # Keep URL unchanged and ignore null values
-                            existing_data[key] = value
-                    batch.contents[encoded_url] = WebpageData.to_webpage_data(
-                        existing_data
-                    )  # Convert back to instance
-                else:
-                    batch.contents[encoded_url] = (
-                        page_data  # Store as WebpageData instance
-                    )
-            except (TypeError, ValueError) as e:
-                print(f"Error processing {encoded_url}: {e}")
-        # Save batch with updated contents
-        batch.save()
-        return batch.contents
+    @classmethod
+    def upsert_many(cls, batch_id, url_data_dict, session=None):
+        """
+        Writes the given webpages into a batch, one small document per webpage.
+
+        Fields already stored for a webpage are kept unless a new value is given,
+        and the webpage is (re)assigned to `batch_id`.
+
+        Args:
+            batch_id (int): Unique identifier for the batch in which webpages are stored.
+            url_data_dict (dict): A mapping of encoded URLs (keys) to webpage data dicts.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
+        """
+        cls._bulk_upsert(batch_id, url_data_dict, "$set", session)
+
+    @classmethod
+    def insert_missing(cls, batch_id, pages, session=None):
+        """
+        Inserts the given webpages into a batch, leaving webpages that already exist
+        (their data and their batch) untouched.
+
+        Args:
+            batch_id (int): Unique identifier for the batch of newly inserted webpages.
+            pages (dict): A mapping of encoded URLs (keys) to webpage data dicts.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
+        """
+        cls._bulk_upsert(
+            batch_id, pages, "$setOnInsert", session, fields_operator="$setOnInsert"
+        )
+
+    @classmethod
+    def iter_batches(cls, chunk=50):
+        """
+        Streams stored batches as `(batch_id, {url key: webpage})` pairs in batch order.
+
+        Webpages are read through a non-caching cursor `chunk` documents at a time and
+        only one batch is held in memory, so this is safe over the whole collection.
+        Consumers receive plain dicts (not Documents), with `html` already decompressed.
+
+        Args:
+            chunk (int, optional): Cursor batch size. Defaults to 50.
+
+        Yields:
+            tuple: `(batch_id, pages)` where `pages` maps URL keys to webpage dicts.
+        """
+        current_batch_id, pages = None, {}
+        webpages = cls.objects.order_by("batch_id").no_cache().batch_size(chunk)
+        for webpage in webpages.as_pymongo():
+            if webpage["batch_id"] != current_batch_id:
+                if pages:
+                    yield current_batch_id, pages
+                current_batch_id, pages = webpage["batch_id"], {}
+            if "html" in webpage:
+                webpage["html"] = decompress_html(webpage["html"])
+            pages[webpage.pop("_id")] = webpage
+        if pages:
+            yield current_batch_id, pages
 
 
 # Define the Index Tracking Schema
@@ -140,6 +385,31 @@ class IndexTracking(meObj.Document):
 
     meta = {"collection": "index_tracking"}
 
+    @classmethod
+    def update_last_processed(
+        cls, last_batch_id: int, last_item_index: int, session=None
+    ):
+        """
+        Atomically updates (or creates) the last processed batch index.
+
+        Args:
+            last_batch_id (int): The last processed batch ID.
+            last_item_index (int): The last processed item index in that batch.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
+        """
+        cls._get_collection().update_one(
+            {"_id": "last_processed_index"},
+            {
+                "$set": {
+                    "last_batch_id": last_batch_id,
+                    "last_item_index": last_item_index,
+                    "updated_at": datetime.now(timezone.utc),  # Auto-update timestamp
+                }
+            },
+            upsert=True,
+            session=session,
+        )
+
 
 # Tracks unique webpage URLs and their lookup data.
 class WebpageUrlLookup(meObj.Document):
@@ -147,12 +417,20 @@ class WebpageUrlLookup(meObj.Document):
     batch_id = meObj.IntField(
         required=True
     )  # The ID of the batch associated with the URL lookup.
-    meta = {"collection": "url_lookup_table"}
+    meta = {
+        "collection": "url_lookup_table",
+        # Covers bulk_data_lookup: the $in match and both returned fields are in the index
+        "indexes": [("pageUrl", "batch_id")],
+    }
 
     @classmethod
-    def bulk_update_webpage_lookup(cls, updates: List[Tuple[str, int]]):
+    def bulk_update_webpage_lookup(cls, updates: List[Tuple[str, int]], session=None):
         """
         Performs a batch update on the `WebpageUrlLookup` collection.
+
+        Args:
+            updates (List[Tuple[str, int]]): (encoded URL, batch ID) pairs to upsert.
+            session (ClientSession, optional): A PyMongo session to run the write in. Defaults to None.
         """
         if not updates:
             return  # No updates to process
@@ -166,9 +444,30 @@ class WebpageUrlLookup(meObj.Document):
                     upsert=True,  # Insert if it doesn't exist
                 )
             )
-        # Execute bulk update operation
-        if bulk_operations:
-            collection.bulk_write(bulk_operations)
+        chunks = [
+            bulk_operations[start : start + LOOKUP_BULK_CHUNK_SIZE]
+            for start in range(0, len(bulk_operations), LOOKUP_BULK_CHUNK_SIZE)
+        ]
+
+        def write_chunk(chunk):
+            # Unordered: the server may apply the independent upserts in parallel
+            return safe_bulk_write(
+                collection,
+                chunk,
+                session=session,
+                bypass_document_validation=True,  # Upserts are built from trusted pairs
+            )
+
+        # A session cannot be shared across threads, so transactional writes stay serial
+        if session is not None or len(chunks) == 1:
+            for chunk in chunks:
+                write_chunk(chunk)
+            return
+        # Otherwise send the chunks concurrently over separate pooled connections
+        with ThreadPoolExecutor(
+            max_workers=min(LOOKUP_BULK_WORKERS, len(chunks))
+        ) as executor:
+            list(executor.map(write_chunk, chunks))
 
     @classmethod
     def bulk_data_lookup(cls, encoded_page_urls: List[str]) -> Dict[str, int]:
@@ -183,10 +482,58 @@ class WebpageUrlLookup(meObj.Document):
         """
         if not encoded_page_urls:
             return {}  # Return empty dict if input is empty
-        # Fetch all matching documents from MongoDB
-        lookups = cls.objects(pageUrl__in=encoded_page_urls)
+        # Fetch only the two indexed fields (no _id), so the query is index-covered
+        lookups = cls._get_collection().find(
+            {"pageUrl": {"$in": encoded_page_urls}},
+            {"_id": 0, "pageUrl": 1, "batch_id": 1},
+        )
         # Map pageUrl -> batch_id
-        return {doc.pageUrl: doc.batch_id for doc in lookups}
+        return {doc["pageUrl"]: doc["batch_id"] for doc in lookups}
+
+
+def create_indexes():
+    """
+    Creates the indexes used by the hot queries up front, rather than on first access
+    from whichever writer thread touches a collection first.
+    """
+    for document_class in (WebpageDoc, WebpageUrlLookup, IndexTracking):
+        document_class.ensure_indexes()
+
+
+def migrate_legacy_batches(chunk=50):
+    """
+    One-time re-key of batches stored before webpages moved to `WebpageDoc`.
+
+    Every page of each legacy `CommonCrawlProcessed` batch is upserted as a `WebpageDoc`
+    keyed by `url_key(url)` (pages that already exist keep their newer data and batch),
+    lookup entries are added for keys not yet tracked, and the legacy Base64 lookup
+    entries are removed. The legacy batch documents are left in place.
+
+    Args:
+        chunk (int, optional): Cursor batch size for reading legacy batches. Defaults to 50.
+
+    Returns:
+        int: The number of legacy pages migrated.
+    """
+    migrated = 0
+    legacy_batches = CommonCrawlProcessed._get_collection().find({}, batch_size=chunk)
+    for batch in legacy_batches:
+        batch_id, contents = batch["batch_id"], batch.get("contents", {})
+        pages = {
+            url_key(page["url"]): page for page in contents.values() if page.get("url")
+        }
+        if pages:
+            WebpageDoc.insert_missing(batch_id, pages)
+            tracked = WebpageUrlLookup.bulk_data_lookup(list(pages))
+            WebpageUrlLookup.bulk_update_webpage_lookup(
+                [(key, batch_id) for key in pages if key not in tracked]
+            )
+        WebpageUrlLookup._get_collection().delete_many(
+            {"pageUrl": {"$in": list(contents)}}
+        )
+        migrated += len(pages)
+        print(f"Migrated legacy batch {batch_id} with {len(pages)} webpages.")
+    return migrated
 
 
 # # Test function
@@ -1,42 +1,73 @@
-from bs4 import BeautifulSoup
-from typing import Dict, List
+from lxml import etree, html as lxml_html
+from selectolax.lexbor import LexborHTMLParser
+from typing import Dict, List, Union
 import re
 
+# Compiled once; matches every h1-h5 in document order during a single walk
+HEADINGS_XPATH = etree.XPath(
+    ".//*[self::h1 or self::h2 or self::h3 or self::h4 or self::h5]"
+)
+# Visible text nodes; skips script and style bodies without mutating the tree
+VISIBLE_TEXT_XPATH = etree.XPath(
+    "//text()[not(ancestor::script) and not(ancestor::style)]"
+)
+
+
+def _parse_document(html_content: Union[str, bytes]):
+    """Parse a page into an lxml tree, tolerating empty and XML-declared input."""
+    if not html_content or not html_content.strip():
+        html_content = "<html></html>"
+    try:
+        try:
+            return lxml_html.document_fromstring(html_content)
+        except ValueError:
+            # lxml rejects str input that carries an XML encoding declaration
+            return lxml_html.document_fromstring(html_content.encode("utf-8"))
+    except etree.ParserError:
+        # Only a doctype, comment, processing instruction or CDATA; no elements
+        return lxml_html.document_fromstring("<html></html>")
+
+
+def _element_text(element) -> str:
+    """Concatenate an element's stripped text nodes, like `get_text(strip=True)`."""
+    return "".join(text.strip() for text in element.itertext())
+
 
 class HTMLParser:
     """A utility class to parse HTML and extract structured elements."""
 
-    def __init__(self, html_content: str):
-        self.soup = BeautifulSoup(html_content, "html.parser")
+    # One parser per page; no per-instance __dict__
+    __slots__ = ("tree",)
+
+    def __init__(self, html_content: Union[str, bytes]):
+        # Plain lxml tree; avoids building a Python wrapper object per node
+        self.tree = _parse_document(html_content)
 
     def get_title(self) -> Dict[str, str]:
         """Extract the page title."""
-        title = self.soup.title.get_text(strip=True) if self.soup.title else "No Title"
-        return {"title": title}
+        title = self.tree.find(".//title")
+        return {"title": _element_text(title) if title is not None else "No Title"}
 
     def get_headings(self) -> Dict[str, List[str]]:
         """Extract headings (h1-h5)."""
         headings_map = {f"h{i}": [] for i in range(1, 6)}
-        for level in headings_map:
-            elements = self.soup.find_all(level)
-            for tag in elements:
-                text = tag.get_text(strip=True)
-                headings_map[level].append(text)
+        for element in HEADINGS_XPATH(self.tree):
+            headings_map[element.tag].append(_element_text(element))
         return headings_map
 
     def get_links(self) -> List[Dict[str, str]]:
         """Extract anchor links."""
         links = [
-            {"text": tag.get_text(strip=True), "href": tag.get("href", "#")}
-            for tag in self.soup.find_all("a")
+            {"text": _element_text(element), "href": element.get("href", "#")}
+            for element in self.tree.iter("a")
         ]
         return links
 
     def get_meta_tags(self) -> Dict[str, str]:
         """Extract meta tags (description & keywords)."""
         meta_tags = {
-            meta.get("name", "").lower(): meta.get("content", "")
-            for meta in self.soup.find_all("meta")
+            meta.get("name").lower(): meta.get("content", "")
+            for meta in self.tree.iter("meta")
             if meta.get("name")
         }
         return meta_tags
@@ -49,11 +80,10 @@ class HTMLParser:
             - "text": The full cleaned text.
             - "sentences": A list of sentences extracted from the text.
         """
-        # Remove scripts & styles
-        for tag in self.soup(["script", "style"]):
-            tag.extract()
-        # Get visible text, normalize spaces
-        clean_text = " ".join(self.soup.get_text(separator=" ").split())
+        # Visible text nodes only; skips scripts, styles and comments
+        texts = VISIBLE_TEXT_XPATH(self.tree)
+        # Normalize spaces
+        clean_text = " ".join(" ".join(texts).split())
         # Use regex to split sentences efficiently
         sentences = re.split(r"(?<=[.!?])\s+", clean_text.strip())
         # Remove any empty strings that might appear due to extra spaces
@@ -62,25 +92,57 @@ class HTMLParser:
 
     def get_scripts(self, limit: int = 3) -> Dict[str, List[str]]:
         """Extract embedded and external JavaScript sources."""
-        scripts_map = {
-            "embedded_scripts": [
-                script.get_text(strip=True)
-                for script in self.soup.find_all("script")
-                if script.string
-            ][:limit],
-            "external_scripts": [
-                script["src"]
-                for script in self.soup.find_all("script", src=True)
-                if "src" in script.attrs
-            ][:limit],
+        embedded_scripts = []
+        external_scripts = []
+        # One walk over the script elements, sorting each into both buckets
+        for script in self.tree.iter("script"):
+            if script.text and len(script) == 0 and len(embedded_scripts) < limit:
+                embedded_scripts.append(script.text.strip())
+            src = script.get("src")
+            if src is not None and len(external_scripts) < limit:
+                external_scripts.append(src)
+            if len(embedded_scripts) >= limit and len(external_scripts) >= limit:
+                break
+        return {
+            "embedded_scripts": embedded_scripts,
+            "external_scripts": external_scripts,
+        }
+
+    @staticmethod
+    def extract_scripts(
+        html_content: Union[str, bytes], limit: int = 3
+    ) -> Dict[str, List[str]]:
+        """
+        Extract embedded and external JavaScript sources without building a tree.
+
+        Uses the lexbor C parser, which is faster than a full lxml parse on large
+        crawl pages; returns the same mapping as `get_scripts`. Raw UTF-8 bytes are
+        accepted, so callers need not decode the page first.
+        """
+        embedded_scripts = []
+        external_scripts = []
+        # Same single walk and rules as get_scripts: inline bodies (kept even when
+        # whitespace-only, or when the script also has a src) and every src value
+        for script in LexborHTMLParser(html_content).css("script"):
+            text = script.text()
+            if text and len(embedded_scripts) < limit:
+                embedded_scripts.append(text.strip())
+            attributes = script.attributes
+            if "src" in attributes and len(external_scripts) < limit:
+                # lexbor reports a valueless attribute as None where lxml gives ""
+                external_scripts.append(attributes["src"] or "")
+            if len(embedded_scripts) >= limit and len(external_scripts) >= limit:
+                break
+        return {
+            "embedded_scripts": embedded_scripts,
+            "external_scripts": external_scripts,
         }
-        return scripts_map
 
     def get_images(self) -> List[Dict[str, str]]:
         """Extract image sources."""
         images = [
             {"src": tag.get("src", ""), "alt": tag.get("alt", "")}
-            for tag in self.soup.find_all("img")
+            for tag in self.tree.iter("img")
         ]
         return images
 
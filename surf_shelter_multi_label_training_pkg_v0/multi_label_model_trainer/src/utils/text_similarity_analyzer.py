@@ -4,6 +4,46 @@ from .batch_data_retriever import fetch_content
 from .url_cleaner import URLCleaner
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import torch
+from functools import lru_cache
+
+
+@lru_cache(maxsize=65536)
+def _url_component_strings(url):
+    """
+    Normalizes and parses a URL once, returning its path, query and netloc parts.
+
+    Cached so URLs repeated across pages are only normalized once.
+    """
+    normalized_url = URLCleaner.normalize_url(url)
+    url_components_dict = URLCleaner.extract_url_components(normalized_url)
+    # Choose path, query and netloc part of url to encode
+    return tuple(url_components_dict[key] for key in ("path", "query", "netloc"))
+
+
+def flatten_url_content_pairs(url_content_pairs):
+    """
+    Flattens (url, content_list) pairs into one list of texts to encode.
+
+    Args:
+        url_content_pairs (list): (url, content_list) tuples to analyze.
+
+    Returns:
+        tuple: The texts, and an (index, start, split, end) span per pair with content,
+        where texts[start:split] is the content and texts[split:end] the URL components.
+    """
+    texts = []
+    spans = []
+    for index, (url, content_list) in enumerate(url_content_pairs):
+        if not content_list:
+            continue
+        # Content first, then path, query and netloc components of the URL
+        start = len(texts)
+        texts.extend(content_list)
+        split = len(texts)
+        texts.extend(_url_component_strings(url))
+        spans.append((index, start, split, len(texts)))
+    return texts, spans
 
 
 class TextSimilarityAnalyzer:
@@ -11,14 +51,20 @@ class TextSimilarityAnalyzer:
     Labels text similarity by comparing two sets of text using SBERT.
     """
 
-    def __init__(self, model_name="distilbert-base-nli-stsb-mean-tokens"):
+    def __init__(self, model_name="distilbert-base-nli-stsb-mean-tokens", device=None):
         """
         Initializes the TextSimilarityLabeller.
 
         Args:
             model_name (str): The name of the Sentence Transformer model to use.
+            device (str): The torch device to run on; defaults to CUDA when available.
         """
-        self.model = SentenceTransformer(model_name)
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer(model_name, device=device)
+        if device.startswith("cuda"):
+            # FP16 halves memory traffic and runs on tensor cores
+            self.model.half()
         self.url_cleaner = URLCleaner()
 
     def calculate_similarity(self, embeddings1, embeddings2):
@@ -33,15 +79,20 @@ class TextSimilarityAnalyzer:
             float: The normalized cosine similarity score in the range [0, 1], suitable for binary classification.
         """
         # Average the embeddings across all content and URL components
-        avg_embeddings1 = np.mean(embeddings1, axis=0)
-        avg_embeddings2 = np.mean(embeddings2, axis=0)
-
-        cosine_similarity = np.dot(avg_embeddings1, avg_embeddings2) / (
-            np.linalg.norm(avg_embeddings1) * np.linalg.norm(avg_embeddings2)
+        embeddings1 = np.ascontiguousarray(embeddings1, dtype=np.float32)
+        embeddings2 = np.ascontiguousarray(embeddings2, dtype=np.float32)
+        avg_embeddings1 = embeddings1.mean(axis=0)
+        avg_embeddings2 = embeddings2.mean(axis=0)
+
+        # Dot products only; the norms come from the same BLAS kernel as the dot
+        cosine_similarity = float(avg_embeddings1 @ avg_embeddings2) / (
+            np.sqrt(avg_embeddings1 @ avg_embeddings1)
+            * np.sqrt(avg_embeddings2 @ avg_embeddings2)
+            + 1e-9
         )
 
         # Normalize cosine similarity from [-1, 1] to [0, 1]
-        normalized_cosine_similarity = (cosine_similarity + 1) / 2
+        normalized_cosine_similarity = (cosine_similarity + 1) * 0.5
         return normalized_cosine_similarity
 
     def url_matching_content(self, url, content_list, similarity_threshold=0.80):
@@ -56,39 +107,82 @@ class TextSimilarityAnalyzer:
         Returns:
             tuple: A tuple containing a boolean indicating if the URL matches and the maximum similarity score.
         """
-        if not content_list:
-            return False, 0.0  # Return default values if content is empty
+        matches = self.url_matching_contents([(url, content_list)], similarity_threshold)
+        return matches[0]
 
-        # Normalize the URL
-        normalized_url = self.url_cleaner.normalize_url(url)
+    def url_matching_contents(
+        self, url_content_pairs, similarity_threshold=0.80, batch_size=64
+    ):
+        """
+        Labels many URLs at once, encoding all of their texts in a single batched pass.
+
+        Args:
+            url_content_pairs (list): (url, content_list) tuples to analyze.
+            similarity_threshold (float): The threshold for similarity to consider the URL matching.
+            batch_size (int): The number of strings the model encodes per forward pass.
+
+        Returns:
+            list: A (match, similarity) tuple per pair, in input order.
+        """
+        texts, spans = flatten_url_content_pairs(url_content_pairs)
+        return self.score_flattened_pairs(
+            len(url_content_pairs), texts, spans, similarity_threshold, batch_size
+        )
 
-        # Extract URL components
-        url_components_dict = self.url_cleaner.extract_url_components(normalized_url)
-        url_components = []
-        # Choose path, query and netloc part of url to encode
-        for key in ["path", "query", "netloc"]:
-            if key in url_components_dict:
-                url_components.append(url_components_dict[key])
-        print(url_components)
+    def score_flattened_pairs(
+        self, pair_count, texts, spans, similarity_threshold=0.80, batch_size=64
+    ):
+        """
+        Scores pairs already flattened by `flatten_url_content_pairs`.
 
+        Lets callers that run several models flatten (and parse URLs) only once.
 
-        content_embeddings = self.model.encode(content_list)  # Safe to encode now
-        url_component_embeddings = self.model.encode(url_components)
+        Args:
+            pair_count (int): The number of (url, content_list) pairs flattened.
+            texts (list): The flattened texts to encode.
+            spans (list): The (index, start, split, end) span of each pair with content.
+            similarity_threshold (float): The threshold for similarity to consider the URL matching.
+            batch_size (int): The number of strings the model encodes per forward pass.
 
-        max_similarity = self.calculate_similarity(
-            content_embeddings, url_component_embeddings
-        )
-        return max_similarity >= similarity_threshold, max_similarity
+        Returns:
+            list: A (match, similarity) tuple per pair, in input order.
+        """
+        results = [(False, 0.0)] * pair_count  # Default for empty content
+        if not texts:
+            return results
+
+        embeddings = self.model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+        # Spans are contiguous, alternating content and URL segments; average each
+        # segment with one reduceat instead of a mean per pair
+        boundaries = np.array([bound for span in spans for bound in span[1:3]])
+        sizes = np.diff(np.append(boundaries, len(texts)))
+        averages = np.add.reduceat(embeddings, boundaries, axis=0) / sizes[:, None]
+        # Unit-normalize every average once so cosine similarity is a plain dot;
+        # the floor matches calculate_similarity, so a zero average scores 0.5
+        averages /= np.maximum(np.linalg.norm(averages, axis=1, keepdims=True), 1e-9)
+        content_averages, url_averages = averages[0::2], averages[1::2]
+
+        # Row-wise cosine similarity for every pair at once, mapped to [0, 1]
+        cosine_similarities = np.einsum("ij,ij->i", content_averages, url_averages)
+        normalized_similarities = (cosine_similarities + 1) * 0.5
+        for (index, *_), max_similarity in zip(spans, normalized_similarities):
+            results[index] = (max_similarity >= similarity_threshold, max_similarity)
+        return results
 
 
 def analyze_similarity(url_content_pairs):
     """Analyze similarity using SBERT models."""
     models = ["all-MiniLM-L6-v2", "distilbert-base-nli-stsb-mean-tokens"]
     results = {"Model": [], "URL": [], "Similarity": [], "Match": []}
+    # Parse URLs and lay out the texts once; every model encodes the same batch
+    texts, spans = flatten_url_content_pairs(url_content_pairs)
     for model_name in models:
         analyzer = TextSimilarityAnalyzer(model_name=model_name)
-        for url, content_list in url_content_pairs:
-            match, similarity = analyzer.url_matching_content(url, content_list)
+        matches = analyzer.score_flattened_pairs(len(url_content_pairs), texts, spans)
+        for (url, _), (match, similarity) in zip(url_content_pairs, matches):
             results["Model"].append(model_name)
             results["URL"].append(url)
             results["Similarity"].append(similarity)
@@ -1,7 +1,88 @@
 import re
-from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit, urlunsplit
+import numpy as np
+import pandas as pd
 from url_normalize import url_normalize
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Indel
+
+# Cleaned URLs memoized by clean_url; crawl and feed URLs repeat heavily
+CLEAN_URL_CACHE_SIZE = 262144
+# Below this many URLs, process start-up costs more than cleaning them inline
+PARALLEL_CLEAN_MIN_URLS = 20000
+# Scheme -> the netloc suffix of its default port
+DEFAULT_PORT_SUFFIXES = {'http': (80, ':80'), 'https': (443, ':443')}
+# A default port ending the netloc of a raw http(s) URL string
+HTTP_DEFAULT_PORT_RE = re.compile(r'^(http://[^/?#]*?):80(?=[/?#]|$)', re.IGNORECASE)
+HTTPS_DEFAULT_PORT_RE = re.compile(r'^(https://[^/?#]*?):443(?=[/?#]|$)', re.IGNORECASE)
+# ASCII http(s) URLs that url_normalize would return unchanged apart from the case
+# of the scheme and host: no port, userinfo, fragment, percent-escapes or dot
+# segments, and only unreserved characters in the path and query
+_PATH_SEGMENT = r'(?!\.\.?(?:[/?]|$))[a-z0-9._~-]+'
+_QUERY_PAIR = r'[a-z0-9._~+-]+(?:=[a-z0-9._~+-]*)?'
+_NORMAL_TAIL = (
+    rf'/(?:{_PATH_SEGMENT}(?:/{_PATH_SEGMENT})*/?)?'
+    rf'(?:\?{_QUERY_PAIR}(?:&{_QUERY_PAIR})*)?'
+)
+ALREADY_NORMAL_URL_RE = re.compile(
+    r'(?P<origin>https?://[a-z0-9-]+(?:\.[a-z0-9-]+)*)' + _NORMAL_TAIL,
+    re.IGNORECASE | re.ASCII,
+)
+# http(s) URLs whose path and query are already normal but whose origin may not be
+# (ports, userinfo, IDN or mixed-case hosts); only the origin needs url_normalize
+NORMAL_TAIL_URL_RE = re.compile(
+    r'(?P<origin>https?://[^/?#\s\\]+)' + _NORMAL_TAIL,
+    re.IGNORECASE | re.ASCII,
+)
+# Distinct scheme://host origins memoized by _normalize_origin
+ORIGIN_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=ORIGIN_CACHE_SIZE)
+def _normalize_origin(origin):
+    """Return url_normalize's form of a bare scheme://netloc origin."""
+    # Normalizing the root URL yields the origin followed by its "/" path
+    return url_normalize(origin + '/')[:-1]
+
+
+def _strip_default_port(parsed_url):
+    """Return the netloc of a split URL without its scheme's default port."""
+    netloc = parsed_url.netloc
+    default_port = DEFAULT_PORT_SUFFIXES.get(parsed_url.scheme)
+    # A suffix check rules out almost every netloc before the port is parsed
+    if (
+        default_port
+        and netloc.endswith(default_port[1])
+        and parsed_url.port == default_port[0]
+    ):
+        # Cut only the trailing port; a ':80' inside the userinfo must survive
+        netloc = netloc[: -len(default_port[1])]
+    return netloc
+
+
+def _collapse_slashes(path):
+    """Return the path with runs of slashes collapsed into one."""
+    # str.replace is a C loop; each pass halves every run, so long runs converge fast
+    while '//' in path:
+        path = path.replace('//', '/')
+    return path
+
+
+def _query_pair_key(pair):
+    """Sort key for a raw "key=value" query pair: by key, then value."""
+    key, _, value = pair.partition('=')
+    return key, value
+
+
+def _sorted_query(query):
+    """Return the query string with its parameters sorted by key, encoding intact."""
+    if '&' not in query:
+        return query
+    # Sort the raw pairs; no percent-decoding and re-encoding round trip
+    return '&'.join(sorted(filter(None, query.split('&')), key=_query_pair_key))
+
 
 class URLCleaner:
     """
@@ -27,6 +108,16 @@ class URLCleaner:
         Returns:
             str: The normalized URL.
         """
+        # Fast path for the common already-normal crawl URL
+        match = ALREADY_NORMAL_URL_RE.fullmatch(raw_url)
+        if match:
+            origin_end = match.end('origin')
+            return raw_url[:origin_end].lower() + raw_url[origin_end:]
+        # Normal path and query: reuse the host's cached normalized origin
+        match = NORMAL_TAIL_URL_RE.fullmatch(raw_url)
+        if match:
+            origin_end = match.end('origin')
+            return _normalize_origin(raw_url[:origin_end]) + raw_url[origin_end:]
         return url_normalize(raw_url)
 
     @staticmethod
@@ -61,13 +152,11 @@ class URLCleaner:
         Returns:
             str: The URL without the default port.
         """
-        parsed_url = urlparse(url)
-        netloc = parsed_url.netloc
-        if parsed_url.scheme == 'http' and parsed_url.port == 80:
-            netloc = netloc.replace(':80', '')
-        elif parsed_url.scheme == 'https' and parsed_url.port == 443:
-            netloc = netloc.replace(':443', '')
-        return urlunparse(parsed_url._replace(netloc=netloc))
+        if ':80' not in url and ':443' not in url:
+            return url
+        # Precompiled substitutions on the raw string; no split/unsplit round trip
+        url = HTTP_DEFAULT_PORT_RE.sub(r'\1', url, count=1)
+        return HTTPS_DEFAULT_PORT_RE.sub(r'\1', url, count=1)
 
     @staticmethod
     def sort_query_parameters(url):
@@ -80,10 +169,10 @@ class URLCleaner:
         Returns:
             str: The URL with sorted query parameters.
         """
-        parsed_url = urlparse(url)
-        query_params = parse_qsl(parsed_url.query, keep_blank_values=True)
-        sorted_query = urlencode(sorted(query_params))
-        return urlunparse(parsed_url._replace(query=sorted_query))
+        if '?' not in url:
+            return url
+        parts = urlsplit(url)
+        return urlunsplit(parts._replace(query=_sorted_query(parts.query)))
 
     @staticmethod
     def remove_duplicate_slashes(url):
@@ -96,9 +185,11 @@ class URLCleaner:
         Returns:
             str: The URL with duplicate slashes removed.
         """
-        parsed_url = urlparse(url)
-        normalized_path = re.sub(r'/{2,}', '/', parsed_url.path)
-        return urlunparse(parsed_url._replace(path=normalized_path))
+        # Look past the scheme's "//" for a duplicate slash
+        if '//' not in url[url.find('://') + 3:]:
+            return url
+        parts = urlsplit(url)
+        return urlunsplit(parts._replace(path=_collapse_slashes(parts.path)))
 
     @staticmethod
     def remove_fragment(url):
@@ -111,10 +202,11 @@ class URLCleaner:
         Returns:
             str: The URL without the fragment.
         """
-        parsed_url = urlparse(url)
-        return urlunparse(parsed_url._replace(fragment=''))
+        fragment_start = url.find('#')
+        return url if fragment_start == -1 else url[:fragment_start]
 
     @staticmethod
+    @lru_cache(maxsize=CLEAN_URL_CACHE_SIZE)
     def clean_url(raw_url):
         """
         Cleans the URL by normalizing, removing default ports, sorting query parameters, 
@@ -126,22 +218,81 @@ class URLCleaner:
         Returns:
             str: The cleaned URL.
         """
-        # Normalize the URL
         normalized_url = URLCleaner.normalize_url(raw_url)
-        
-        # Remove default ports if present
-        url_without_default_port = URLCleaner.remove_default_port(normalized_url)
-        
-        # Sort query parameters alphabetically
-        url_with_sorted_query = URLCleaner.sort_query_parameters(url_without_default_port)
-        
-        # Remove duplicate slashes from the path
-        url_without_duplicate_slashes = URLCleaner.remove_duplicate_slashes(url_with_sorted_query)
-        
-        # Remove the fragment
-        final_url = URLCleaner.remove_fragment(url_without_duplicate_slashes)
-        
-        return final_url
+        if ALREADY_NORMAL_URL_RE.fullmatch(normalized_url):
+            # No port, fragment or duplicate slashes to strip; slice off the query and
+            # sort it without running the URL parser at all
+            base, _, query = normalized_url.partition('?')
+            return f'{base}?{_sorted_query(query)}' if query else base
+        # Otherwise apply the remaining steps to a single split
+        parts = urlsplit(normalized_url)
+        return urlunsplit(
+            parts._replace(
+                # Remove default ports if present
+                netloc=_strip_default_port(parts),
+                # Remove duplicate slashes from the path
+                path=_collapse_slashes(parts.path),
+                # Sort query parameters alphabetically
+                query=_sorted_query(parts.query),
+                # Remove the fragment
+                fragment='',
+            )
+        )
+
+    @classmethod
+    def clean_batch(cls, urls, workers=None, chunksize=1024):
+        """
+        Cleans many URLs, spreading large batches across worker processes.
+
+        Args:
+            urls (iterable): The raw URLs to clean.
+            workers (int): The number of worker processes (defaults to the CPU count).
+            chunksize (int): The number of URLs handed to a worker at a time.
+
+        Returns:
+            list: The cleaned URLs, in input order.
+        """
+        urls = list(urls)
+        if len(urls) < PARALLEL_CLEAN_MIN_URLS:
+            return [cls.clean_url(url) for url in urls]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(cls.clean_url, urls, chunksize=chunksize))
+
+    @classmethod
+    def clean_series(cls, urls, workers=None):
+        """
+        Cleans a pandas Series of URLs, cleaning each distinct URL only once.
+
+        Args:
+            urls (pd.Series): The raw URLs to clean; missing values stay missing.
+            workers (int): The number of worker processes for large batches.
+
+        Returns:
+            pd.Series: The cleaned URLs, aligned with the input index.
+        """
+        # Factorize in C, clean the distinct URLs, then gather back by code
+        codes, unique_urls = pd.factorize(urls)
+        cleaned = np.array(
+            cls.clean_batch(unique_urls, workers=workers) + [np.nan], dtype=object
+        )
+        # Code -1 marks a missing URL and picks the trailing NaN
+        return pd.Series(cleaned[codes], index=urls.index, name=urls.name)
+
+    @staticmethod
+    def canonical_key(url):
+        """
+        Returns an exact-match key for URL deduplication.
+
+        Two URLs with the same key are the same page, so bulk deduplication can use
+        a set or dict of keys instead of pairwise fuzzy `compare_urls` calls.
+
+        Args:
+            url (str): The URL to key.
+
+        Returns:
+            str: The cleaned URL.
+        """
+        return URLCleaner.clean_url(url)
 
     @staticmethod
     def compare_urls(url1, url2, fuzz_threshold_ratio):
@@ -156,8 +307,40 @@ class URLCleaner:
         Returns:
             bool: True if the similarity score between the URLs meets or exceeds the threshold, False otherwise.
         """
-        similarity = fuzz.ratio(url1, url2)
-        return similarity >= fuzz_threshold_ratio
+        if url1 == url2:
+            return True
+        # ratio is 200 * matches / (len1 + len2) and matches <= the shorter length,
+        # so very different lengths cannot reach the threshold
+        shorter, longer = sorted((len(url1), len(url2)))
+        if 200 * shorter < fuzz_threshold_ratio * (shorter + longer):
+            return False
+        # fuzz.ratio is 100 * (1 - distance / (len1 + len2)), so the threshold is an
+        # integer bound on the Indel distance; the cutoff lets the DP stop early
+        max_distance = int((shorter + longer) * (100 - fuzz_threshold_ratio) // 100)
+        distance = Indel.distance(url1, url2, score_cutoff=max_distance)
+        return distance <= max_distance
+
+    @staticmethod
+    def compare_many(url, candidate_urls, fuzz_threshold_ratio, limit=None):
+        """
+        Compares one URL against many candidates in a single native batch.
+
+        Args:
+            url (str): The URL to compare.
+            candidate_urls (iterable): The URLs to compare it against.
+            fuzz_threshold_ratio (int): The similarity threshold (0-100) a candidate must meet.
+            limit (int): The maximum number of matches to return (all when None).
+
+        Returns:
+            list: (candidate_url, similarity, index) tuples that meet the threshold, best first.
+        """
+        return process.extract(
+            url,
+            candidate_urls,
+            scorer=fuzz.ratio,
+            score_cutoff=fuzz_threshold_ratio,
+            limit=limit,
+        )
 
 # # Test function
 # if __name__ == "__main__":
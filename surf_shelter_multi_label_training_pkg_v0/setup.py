@@ -1,15 +1,47 @@
 from setuptools import setup, find_packages
 
-# Read the dependencies from requirements file
-def read_requirements():
-    with open("requirements.txt") as f:
-        return f.read().splitlines()
+# Packages imported at runtime; pins match requirements.txt, which also locks
+# their transitive dependencies and the development tools
+INSTALL_REQUIRES = [
+    "boto3==1.36.24",
+    "botocore==1.36.24",
+    "fastwarc==0.15.2",
+    "language-tool-python==2.8.2",
+    "lxml==5.3.1",
+    "matplotlib==3.10.0",
+    "mongoengine==0.29.1",
+    "numpy==2.2.3",
+    "orjson==3.10.15",
+    "pandas==2.2.3",
+    "pymongo==4.11.1",
+    "rapidfuzz==3.12.1",
+    "requests==2.32.3",
+    "scikit-learn==1.6.1",
+    "selectolax==0.3.27",
+    "sentence-transformers==3.4.1",
+    "torch==2.6.0",
+    "transformers==4.49.0",
+    "url-normalize==3.0.1",
+    "xxhash==3.5.0",
+    "zstandard==0.23.0",
+]
+
+# Development tools, installed with `pip install .[dev]`
+EXTRAS_REQUIRE = {
+    "dev": [
+        "black==25.1.0",
+        "mongomock==4.3.0",
+        "pytest==8.3.4",
+    ],
+}
 
 setup(
     name="surf_shelter_multi_label_training_pkg",
     version="0.1",
     packages=find_packages(),
-    python_requires=">=3.7",
-    install_requires=read_requirements(),
+    python_requires=">=3.10",  # numpy 2.2 and pandas 2.2 need 3.10+
+    install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     include_package_data=True, # Ensure necessary package data (non .py files) are accessible
+    package_data={"multi_label_model_trainer": ["data/*.csv", "data/*.gz"]},
 )
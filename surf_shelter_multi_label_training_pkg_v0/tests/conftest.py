@@ -0,0 +1,14 @@
+import importlib.util
+from pathlib import Path
+
+# Modules are loaded from their files: the package __init__ pulls in the full ML stack
+UTILS_DIR = Path(__file__).resolve().parents[1] / "multi_label_model_trainer/src/utils"
+
+
+def load_utils_module(relative_path):
+    """Imports a standalone module under `src/utils` by its file path."""
+    path = UTILS_DIR / relative_path
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,80 @@
+import mongoengine
+import mongomock
+import pytest
+from conftest import load_utils_module
+
+
+@pytest.fixture(scope="module")
+def schema():
+    # Connect first so the module's get_connection() reuses the in-memory client
+    mongoengine.connect(
+        "test", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient
+    )
+    yield load_utils_module("data_schemas/common_crawl_processed_schema.py")
+    mongoengine.disconnect()
+
+
+def apply_one_by_one(collection, operations, session=None, **kwargs):
+    """Stands in for `safe_bulk_write`; mongomock cannot run the driver's bulk API."""
+    for operation in operations:
+        collection.update_one(
+            operation._filter, operation._doc, upsert=operation._upsert
+        )
+
+
+@pytest.fixture(autouse=True)
+def empty_collections(schema, monkeypatch):
+    monkeypatch.setattr(schema, "safe_bulk_write", apply_one_by_one)
+    for document_class in (
+        schema.CommonCrawlProcessed,
+        schema.WebpageDoc,
+        schema.WebpageUrlLookup,
+    ):
+        document_class._get_collection().delete_many({})
+
+
+def test_migrate_legacy_batches_leaves_existing_pages_unchanged(schema):
+    existing_url = "https://example.com/kept"
+    new_url = "https://example.com/migrated"
+    existing_key = schema.url_key(existing_url)
+    schema.WebpageDoc.upsert_many(
+        7,
+        {
+            existing_key: {
+                "url": existing_url,
+                "html": "<p>newer</p>",
+                "title": "Newer title",
+                "links": ["https://example.com/newer"],
+            }
+        },
+    )
+    webpage_docs = schema.WebpageDoc._get_collection()
+    existing_before = webpage_docs.find_one({"_id": existing_key})
+    schema.CommonCrawlProcessed._get_collection().insert_one(
+        {
+            "batch_id": 1,
+            "contents": {
+                "legacy-existing": {
+                    "url": existing_url,
+                    "html": "<p>stale</p>",
+                    "title": "Stale title",
+                    "links": ["https://example.com/stale"],
+                },
+                "legacy-new": {
+                    "url": new_url,
+                    "html": "<p>legacy</p>",
+                    "title": "Legacy title",
+                    "links": ["https://example.com/legacy"],
+                },
+            },
+        }
+    )
+
+    assert schema.migrate_legacy_batches() == 2
+
+    assert webpage_docs.find_one({"_id": existing_key}) == existing_before
+    migrated = webpage_docs.find_one({"_id": schema.url_key(new_url)})
+    assert migrated["batch_id"] == 1
+    assert migrated["title"] == "Legacy title"
+    assert migrated["links"] == ["https://example.com/legacy"]
+    assert schema.decompress_html(migrated["html"]) == "<p>legacy</p>"
@@ -0,0 +1,60 @@
+import pytest
+from conftest import load_utils_module
+
+HTMLParser = load_utils_module("html_parser.py").HTMLParser
+
+SCRIPTS_PAGE = """<html><head>
+<script>console.log('first');</script>
+<script src="https://example.com/a.js">window.fallback = true;</script>
+<script>   </script>
+<script src=""></script>
+<script src></script>
+</head><body>
+<script src="https://example.com/b.js"></script>
+<script>  console.log('second');  </script>
+<script src="https://example.com/c.js"></script>
+</body></html>"""
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_extract_scripts_matches_get_scripts(limit):
+    expected = HTMLParser(SCRIPTS_PAGE).get_scripts(limit)
+    assert HTMLParser.extract_scripts(SCRIPTS_PAGE, limit) == expected
+    assert HTMLParser.extract_scripts(SCRIPTS_PAGE.encode(), limit) == expected
+
+
+def test_extract_scripts_keeps_bodies_with_src_and_empty_values():
+    scripts = HTMLParser.extract_scripts(SCRIPTS_PAGE, limit=10)
+    assert scripts["embedded_scripts"] == [
+        "console.log('first');",
+        "window.fallback = true;",
+        "",
+        "console.log('second');",
+    ]
+    assert scripts["external_scripts"] == [
+        "https://example.com/a.js",
+        "",
+        "",
+        "https://example.com/b.js",
+        "https://example.com/c.js",
+    ]
+
+
+@pytest.mark.parametrize(
+    "html_content",
+    [
+        "",
+        "   ",
+        "<!DOCTYPE html>",
+        "<!-- x -->",
+        "<?php echo 1; ?>",
+        "<![CDATA[x]]>",
+        '<?xml version="1.0" encoding="utf-8"?>',
+        b"<!DOCTYPE html>",
+    ],
+)
+def test_pages_without_elements_parse_as_empty_documents(html_content):
+    parser = HTMLParser(html_content)
+    assert parser.get_title() == {"title": "No Title"}
+    assert parser.get_clean_text() == {"text": "", "sentences": []}
+    assert parser.get_scripts() == {"embedded_scripts": [], "external_scripts": []}